@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 
+import errno
+import functools
+import hashlib
 import os
-import shutil
 import sys
 from pathlib import Path
-from datetime import datetime
 from textwrap import dedent
-import time
 
 # --- Configuration ---
-NVIM_CONFIG_DIR = Path.home() / ".config" / "nvim"
-NVIM_SHARE_DIR = Path.home() / ".local" / "share" / "nvim"
-NVIM_STATE_DIR = Path.home() / ".local" / "state" / "nvim"
-BACKUP_BASE_DIR = Path.home() / "nvim_backups"
+_HOME = Path.home()
+NVIM_CONFIG_DIR = _HOME / ".config" / "nvim"
+NVIM_SHARE_DIR = _HOME / ".local" / "share" / "nvim"
+NVIM_STATE_DIR = _HOME / ".local" / "state" / "nvim"
+BACKUP_BASE_DIR = _HOME / "nvim_backups"
+# Set NVIM_SETUP_VERBOSE=1 (or pass --verbose) to list the config tree after setup
+VERBOSE = bool(os.environ.get("NVIM_SETUP_VERBOSE"))
+# Set NVIM_SETUP_YES=1 (or pass --yes) to answer yes to every prompt
+ASSUME_YES = bool(os.environ.get("NVIM_SETUP_YES"))
 
 # --- Minimal Configuration Content ---
 config_files_content = {
@@ -227,21 +232,57 @@ config_files_content = {
         print('lazy.nvim configured.')
     """,
 }
+# Normalize the templates once at import time rather than on every write
+config_files_content = {
+    path: dedent(content).strip().encode('utf-8')
+    for path, content in config_files_content.items()
+}
+
+def _config_digest(files_content):
+    """BLAKE2 digest over the relative paths and contents, in path order."""
+    h = hashlib.blake2b()
+    for relative_path in sorted(files_content):
+        h.update(relative_path.as_posix().encode('utf-8') + b"\0")
+        h.update(files_content[relative_path])
+    return h.hexdigest()
+
+CONFIG_DIGEST = _config_digest(config_files_content)
 
 # --- Helper Functions ---
+_ERROR = "\033[91mERROR: "
+_SUCCESS = "\033[92mSUCCESS: "
+_WARNING = "\033[93mWARNING: "
+_INFO = "\033[94mINFO: "
+_RESET = "\033[0m\n"
+
 def print_error(msg):
-    print(f"\033[91mERROR: {msg}\033[0m", file=sys.stderr)
+    write = sys.stderr.write
+    write(_ERROR)
+    write(str(msg))
+    write(_RESET)
 
 def print_success(msg):
-    print(f"\033[92mSUCCESS: {msg}\033[0m")
+    write = sys.stdout.write
+    write(_SUCCESS)
+    write(str(msg))
+    write(_RESET)
 
 def print_warning(msg):
-    print(f"\033[93mWARNING: {msg}\033[0m")
+    write = sys.stdout.write
+    write(_WARNING)
+    write(str(msg))
+    write(_RESET)
 
 def print_info(msg):
-    print(f"\033[94mINFO: {msg}\033[0m")
+    write = sys.stdout.write
+    write(_INFO)
+    write(str(msg))
+    write(_RESET)
 
 def confirm(prompt):
+    if ASSUME_YES:
+        print(f"{prompt} [y/N]: y")
+        return True
     while True:
         response = input(f"{prompt} [y/N]: ").lower().strip()
         if response in ('y', 'yes'):
@@ -251,40 +292,207 @@ def confirm(prompt):
         else:
             print("Please answer 'yes' or 'no'.")
 
-def check_permissions(path):
-    """Check if the path is writable."""
+def _scandir_recursive(path):
+    """Yield os.DirEntry objects for everything under path, depth-first."""
     try:
-        if path.exists():
-            return os.access(path, os.W_OK)
-        else:
-            parent = path.parent
-            parent.mkdir(parents=True, exist_ok=True)
-            return os.access(parent, os.W_OK)
-    except Exception as e:
-        print_error(f"Permission check failed for {path}: {e}")
-        return False
+        with os.scandir(path) as it:
+            for entry in it:
+                yield entry
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _scandir_recursive(entry.path)
+    except PermissionError as e:
+        print_warning(f"Skipping unreadable directory {path}: {e}")
 
 def list_directory_contents(path):
     """List the contents of the directory recursively."""
     print_info(f"Listing contents of {path}:")
     try:
-        for item in path.rglob("*"):
-            if item.is_file():
-                print(f"  - File: {item}")
-            elif item.is_dir():
-                print(f"  - Dir: {item}")
+        for entry in _scandir_recursive(path):
+            if entry.is_file():
+                print(f"  - File: {entry.path}")
+            elif entry.is_dir():
+                print(f"  - Dir: {entry.path}")
     except Exception as e:
         print_error(f"Failed to list directory contents: {e}")
 
+# ioctl request number for FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+# errno values meaning "this filesystem cannot clone", so fall back to copying
+# (macOS clonefile() reports ENOTSUP, which differs from EOPNOTSUPP there)
+CLONE_UNSUPPORTED = {errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS}
+
+# errno values meaning copy_file_range cannot handle this pair of files
+COPY_RANGE_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+@functools.cache
+def _shutil():
+    """Import shutil on first use; the up-to-date check never needs it."""
+    import shutil
+    return shutil
+
+@functools.cache
+def _clone_function():
+    """
+    Return a function cloning src to dst, raising OSError on failure:
+    clonefile() on macOS (libSystem is loaded once, not per file), the
+    FICLONE ioctl elsewhere.
+    """
+    if sys.platform == "darwin":
+        import ctypes
+        clonefile = ctypes.CDLL("/usr/lib/libSystem.dylib", use_errno=True).clonefile
+
+        def clone(src, dst):
+            if clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err), src)
+        return clone
+
+    import fcntl
+
+    def clone(src, dst):
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    return clone
+
+def _fast_copy(src, dst):
+    """Copy src to dst in the kernel with copy_file_range, else via shutil.copy2."""
+    shutil = _shutil()
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            shutil.copystat(src, dst)
+            return
+        except OSError as e:
+            if e.errno not in COPY_RANGE_UNSUPPORTED:
+                raise
+    shutil.copy2(src, dst)
+
+def _clone_file(src, dst):
+    """Clone src to dst copy-on-write where supported, else copy the bytes."""
+    try:
+        _clone_function()(src, dst)
+        _shutil().copystat(src, dst)
+    except OSError as e:
+        if e.errno not in CLONE_UNSUPPORTED:
+            raise
+        _fast_copy(src, dst)
+
+def _reflink_tree(src, dst):
+    """Recreate the tree at src under dst, cloning regular files and keeping symlinks."""
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            target = os.path.join(dst, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), target)
+            elif entry.is_dir():
+                _reflink_tree(entry.path, target)
+            elif entry.is_file():
+                _clone_file(entry.path, target)
+    _shutil().copystat(src, dst)
+
+def _unlink_quietly(name, dir_fd):
+    try:
+        os.unlink(name, dir_fd=dir_fd)
+    except OSError:
+        pass
+
+def _rmdir_quietly(name, dir_fd):
+    try:
+        os.rmdir(name, dir_fd=dir_fd)
+    except NotADirectoryError:
+        # fwalk lists symlinks to directories alongside real subdirectories
+        _unlink_quietly(name, dir_fd)
+    except OSError:
+        pass
+
+def _fd_rmtree(path):
+    """
+    Remove the tree at path bottom-up with os.fwalk.
+    Every unlink and rmdir is relative to the fd of its parent directory, so
+    the kernel never re-resolves the full path. Errors are ignored, like
+    shutil.rmtree(ignore_errors=True).
+    """
+    for _, dirnames, filenames, dirfd in os.fwalk(path, topdown=False):
+        for name in filenames:
+            _unlink_quietly(name, dirfd)
+        for name in dirnames:
+            _rmdir_quietly(name, dirfd)
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+def config_is_current(config_dir, files_content, digest):
+    """Return True if config_dir already holds exactly the files in files_content."""
+    try:
+        on_disk = {p: (config_dir / p).read_bytes() for p in files_content}
+    except OSError:
+        return False
+    return _config_digest(on_disk) == digest
+
+def _zstd_writer_factory():
+    """
+    Return a callable wrapping a binary file in a level-3 zstd writer, using
+    compression.zstd (Python 3.14+) or the zstandard package. Returns None if
+    neither is available.
+    """
+    try:
+        from compression import zstd
+        return lambda fileobj: zstd.ZstdFile(fileobj, mode='w', level=3)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return lambda fileobj: zstandard.ZstdCompressor(level=3).stream_writer(fileobj)
+
+def _backup_names(items):
+    """
+    Map each item to its name inside a backup: its path relative to the
+    common parent of all items (.config/nvim, .local/share/nvim, ... for
+    the defaults), since every source directory is named nvim. The names
+    never start with '..', so they stay inside the backup.
+    """
+    base = os.path.commonpath([item.parent for item in items])
+    return {item: os.path.relpath(item, base) for item in items}
+
+def _archive_backup(items, archive_path, make_zstd):
+    """
+    Stream items into a zstd-compressed tarball in a single pass.
+    The archive is written to a .part file and renamed into place only once
+    it is complete, so a failed backup never looks like a valid one.
+    """
+    import tarfile
+    partial_path = archive_path.with_name(archive_path.name + ".part")
+    try:
+        with open(partial_path, 'wb') as raw, make_zstd(raw) as compressed, \
+                tarfile.open(fileobj=compressed, mode='w|') as tf:
+            for item, arcname in _backup_names(items).items():
+                print(f"  - Archiving {arcname} into {archive_path}...")
+                tf.add(item, arcname=arcname)
+    except BaseException:
+        try:
+            os.unlink(partial_path)
+        except OSError:
+            pass
+        raise
+    os.replace(partial_path, archive_path)
+
 # --- Core Functions ---
 def backup_config(config_dir, share_dir, state_dir, backup_base_dir):
     """Backs up existing Neovim config, share, and state directories."""
-    if not check_permissions(backup_base_dir):
-        print_error(f"No write permission for backup directory: {backup_base_dir}")
-        return False
-
+    from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_dir = backup_base_dir / f"nvim_backup_{timestamp}"
+    # Prefer one compressed tarball; without zstd, clone into a directory tree
+    make_zstd = _zstd_writer_factory()
+    if make_zstd:
+        backup_path = backup_base_dir / f"nvim_backup_{timestamp}.tar.zst"
+    else:
+        backup_path = backup_base_dir / f"nvim_backup_{timestamp}"
 
     print_info("Preparing backup...")
     backup_items = []
@@ -297,20 +505,33 @@ def backup_config(config_dir, share_dir, state_dir, backup_base_dir):
         print_warning("No existing Neovim configuration found to back up.")
         return True
 
-    if not confirm(f"Backup existing config to '{backup_dir}'?"):
+    if not confirm(f"Backup existing config to '{backup_path}'?"):
         print_warning("Backup aborted by user. Proceeding with setup...")
         return True  # Continue even if backup is aborted
 
     try:
-        backup_dir.mkdir(parents=True, exist_ok=True)
-        for item in backup_items:
-            destination = backup_dir / item.name
-            print(f"  - Backing up {item.name} to {destination}...")
-            if item.is_dir():
-                shutil.copytree(item, destination, symlinks=True, dirs_exist_ok=True)
-            else:
-                shutil.copy2(item, destination)
-        print_success(f"Backup completed successfully to {backup_dir}")
+        (backup_base_dir if make_zstd else backup_path).mkdir(parents=True, exist_ok=True)
+    except PermissionError as e:
+        print_error(f"No write permission for backup directory: {e}")
+        return False
+    except OSError as e:
+        print_error(f"Failed to create backup directory: {e}")
+        return False
+
+    try:
+        if make_zstd:
+            _archive_backup(backup_items, backup_path, make_zstd)
+        else:
+            for item, name in _backup_names(backup_items).items():
+                # Keep config, share and state apart; all three are named nvim
+                destination = backup_path / name
+                print(f"  - Backing up {item} to {destination}...")
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                if item.is_dir():
+                    _reflink_tree(os.fspath(item), os.fspath(destination))
+                else:
+                    _clone_file(os.fspath(item), os.fspath(destination))
+        print_success(f"Backup completed successfully to {backup_path}")
         return True
     except Exception as e:
         print_error(f"Backup failed: {e}")
@@ -318,10 +539,6 @@ def backup_config(config_dir, share_dir, state_dir, backup_base_dir):
 
 def cleanup_old_config(config_dir, share_dir, state_dir):
     """Removes existing Neovim configuration files/dirs."""
-    if not check_permissions(config_dir):
-        print_error(f"No write permission for config directory: {config_dir}")
-        return False
-
     if not confirm("Proceed with removing existing configuration files/dirs?"):
         print_warning("Cleanup aborted by user. Proceeding with setup...")
         return True
@@ -329,6 +546,7 @@ def cleanup_old_config(config_dir, share_dir, state_dir):
     print_info("Cleaning up existing configuration...")
     items_to_remove = [config_dir, share_dir, state_dir]
     removed_count = 0
+    failed = False
     for item in items_to_remove:
         try:
             if item.exists():
@@ -337,47 +555,92 @@ def cleanup_old_config(config_dir, share_dir, state_dir):
                     print(f"  - Removed file: {item}")
                     removed_count += 1
                 elif item.is_dir():
-                    shutil.rmtree(item, ignore_errors=True)
+                    _fd_rmtree(os.fspath(item))
+                    # _fd_rmtree ignores errors; whatever it could not
+                    # remove (e.g. for lack of permission) is still there
+                    if os.path.lexists(item):
+                        print_error(f"Failed to remove {item} completely (check its permissions)")
+                        failed = True
+                        continue
                     print(f"  - Removed directory: {item}")
                     removed_count += 1
         except Exception as e:
             print_error(f"Failed to remove {item}: {e}")
+            failed = True
 
+    if failed:
+        return False
     if removed_count > 0:
         print_success("Cleanup finished.")
     else:
         print_info("No existing configuration items found to clean up.")
     return True
 
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
 def setup_new_config(config_dir, files_content):
     """Creates the new directory structure and writes the configuration files."""
-    if not check_permissions(config_dir):
-        print_error(f"No write permission for config directory: {config_dir}")
+    print_info("Setting up new Neovim configuration...")
+    try:
+        config_dir.mkdir(parents=True, exist_ok=True)
+        cfg_fd = os.open(config_dir, os.O_RDONLY | os.O_DIRECTORY)
+    except PermissionError as e:
+        print_error(f"No write permission for config directory: {e}")
+        return False
+    except OSError as e:
+        print_error(f"Failed to create config directory: {e}")
         return False
 
-    print_info("Setting up new Neovim configuration...")
+    # Every mkdir and open below is relative to cfg_fd, so the kernel resolves
+    # only the path inside the config directory, not the whole home path.
+    # os.makedirs takes no dir_fd, so each subdirectory is created once,
+    # component by component. The writes stay serial: for a handful of small
+    # files a thread pool costs more in dispatch than it overlaps.
     try:
+        made_dirs = set()
+        written_count = 0
+        write = sys.stdout.write
         for relative_path, content in files_content.items():
-            full_path = config_dir / relative_path
-            print(f"  - Creating {full_path}...")
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            full_path.write_text(dedent(content).strip(), encoding='utf-8')
-            # Verify the file was created
-            if full_path.exists():
-                print(f"    - Successfully created: {full_path}")
-            else:
-                print_error(f"    - Failed to create: {full_path}")
-                return False
-        print_success("New configuration files created.")
-        # List directory contents to confirm
-        list_directory_contents(config_dir)
+            for depth in range(1, len(relative_path.parts)):
+                subdir = os.path.join(*relative_path.parts[:depth])
+                if subdir not in made_dirs:
+                    try:
+                        os.mkdir(subdir, dir_fd=cfg_fd)
+                    except FileExistsError:
+                        pass
+                    made_dirs.add(subdir)
+            write(f"  - Creating {config_dir / relative_path}...\n")
+            fd = os.open(relative_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=cfg_fd)
+            try:
+                _write_all(fd, content)
+            finally:
+                os.close(fd)
+            written_count += 1
+        print_success(f"New configuration files created ({written_count} files).")
+        if VERBOSE:
+            list_directory_contents(config_dir)
         return True
     except Exception as e:
         print_error(f"Failed to set up new configuration: {e}")
         return False
+    finally:
+        os.close(cfg_fd)
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Set up a minimal Lua-based Neovim configuration.")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="answer yes to all prompts (same as NVIM_SETUP_YES=1)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="list the config tree after setup (same as NVIM_SETUP_VERBOSE=1)")
+    args = parser.parse_args()
+    ASSUME_YES = ASSUME_YES or args.yes
+    VERBOSE = VERBOSE or args.verbose
+
     print("--- Neovim Lua Configuration Setup ---")
     print(f"Target Neovim config directory: {NVIM_CONFIG_DIR}")
     print("-" * 38)
@@ -387,20 +650,22 @@ if __name__ == "__main__":
         print_error("Python 3.8 or higher is required.")
         sys.exit(1)
 
+    if config_is_current(NVIM_CONFIG_DIR, config_files_content, CONFIG_DIGEST):
+        print_success("Neovim configuration is already up to date. Nothing to do.")
+        sys.exit(0)
+
     # 1. Backup
     if not backup_config(NVIM_CONFIG_DIR, NVIM_SHARE_DIR, NVIM_STATE_DIR, BACKUP_BASE_DIR):
         print_warning("Backup failed. Proceeding with setup...")
         # Continue even if backup fails
 
     print("-" * 38)
-    time.sleep(0.5)
 
     # 2. Cleanup
     if not cleanup_old_config(NVIM_CONFIG_DIR, NVIM_SHARE_DIR, NVIM_STATE_DIR):
         print_warning("Cleanup skipped or failed. Proceeding with setup...")
 
     print("-" * 38)
-    time.sleep(0.5)
 
     # 3. Setup New Configuration
     if not setup_new_config(NVIM_CONFIG_DIR, config_files_content):
@@ -13,40 +13,97 @@
 # - Telescope dependencies
 # - Linux kernel development tools (sparse, cscope, ctags, gdb, crash, kdump, qemu, etc.)
 
+import argparse  # For command-line options (--yes, --skip-verify, --dry-run)
+import hashlib  # For verifying downloaded release archives
 import os  # For interacting with the operating system (e.g., running commands, checking files)
 import subprocess  # For running shell commands
 import sys  # For system-specific parameters and functions (e.g., exiting the script)
+import tarfile  # For extracting release archives in-process
+import tempfile  # For scratch space while unpacking downloads
+import time  # For checking how old the package metadata cache is
 import platform  # For detecting the operating system and distribution
+import re  # For parsing package manager output
+import shlex  # For printing commands in --dry-run mode
 import shutil  # For checking if commands are available
+import threading  # For guarding PATH updates made by concurrent installers
 import urllib.request  # For downloading files (e.g., rustup, go, lazygit)
+from collections import deque  # For keeping the tail of streamed command output
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait  # For running independent installers concurrently
 from pathlib import Path  # For cross-platform path handling
 from textwrap import dedent  # For removing leading whitespace from multi-line strings
+import zipfile  # For extracting the stylua release archive
+from dataclasses import dataclass  # For the resolved distribution details
 
 # --- Configuration ---
 NVIM_CONFIG_DIR = Path.home() / ".config" / "nvim"  # Main Neovim config directory (~/.config/nvim)
+SYSTEM = platform.system()  # Operating system name, looked up once
+KERNEL_RELEASE = platform.release()  # Running kernel release, for the kernel header packages
+ASSUME_YES = bool(os.environ.get("NVIM_SETUP_YES"))  # Answer yes to prompts (also --yes)
+DRY_RUN = False  # Print commands, downloads and file changes instead of performing them (--dry-run)
+METADATA_MAX_AGE = 30 * 60  # Skip package list refreshes newer than this (seconds)
+UPDATE_SENTINEL = Path("/tmp/.nvim_setup_last_update")  # Touched after each successful refresh
+APT_LISTS_DIR = Path("/var/lib/apt/lists")  # Downloaded apt package indexes
+# Files only a successful apt-get update (re)writes
+APT_UPDATE_STAMPS = (Path("/var/cache/apt/pkgcache.bin"), Path("/var/lib/apt/periodic/update-success-stamp"))
+DNF_CACHE_DIRS = (Path("/var/cache/dnf"), Path("/var/cache/libdnf5"))  # dnf4 and dnf5 metadata caches
+DOWNLOAD_CHUNK = 1 << 16  # Buffer size for streamed downloads (64 KiB)
+# Verified release archives, keyed by SHA-256, so re-runs skip the download
+DOWNLOAD_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "nvim_setup"
+STDERR_TAIL_LINES = 200  # Lines of streamed stderr kept for error reports
+# Package manager errors that fail the whole transaction whatever it installs
+# (held locks, network or mirror outages, sudo refusing), so bisecting is futile
+WHOLE_RUN_FAILURE = re.compile(
+    r"Could not get lock|Unable to acquire the dpkg frontend lock|Temporary failure resolving"
+    r"|Failed to fetch|Could not resolve host|Failed to download metadata|^sudo: ",
+    re.MULTILINE,
+)
+_PATH_LOCK = threading.Lock()  # Installers may extend PATH from worker threads
+_OUTPUT_LOCK = threading.Lock()  # Keeps lines logged by concurrent installers whole
+_FOUND_COMMANDS = set()  # Commands already located on PATH
 
 # --- Helper Functions ---
+def write_line(line, stream=None):
+    """
+    Write one line to stream (stdout by default) with a single write.
+    The write and flush happen under _OUTPUT_LOCK, so lines logged by
+    concurrent installers never run together.
+    """
+    stream = stream or sys.stdout
+    if not line.endswith("\n"):
+        line += "\n"
+    with _OUTPUT_LOCK:
+        stream.write(line)
+        stream.flush()
+
 def print_error(msg):
     """Print an error message in red to stderr."""
-    print(f"\033[91mERROR: {msg}\033[0m", file=sys.stderr)
+    write_line(f"\033[91mERROR: {msg}\033[0m", sys.stderr)
 
 def print_success(msg):
     """Print a success message in green."""
-    print(f"\033[92mSUCCESS: {msg}\033[0m")
+    write_line(f"\033[92mSUCCESS: {msg}\033[0m")
 
 def print_warning(msg):
     """Print a warning message in yellow."""
-    print(f"\033[93mWARNING: {msg}\033[0m")
+    write_line(f"\033[93mWARNING: {msg}\033[0m")
 
 def print_info(msg):
     """Print an info message in blue."""
-    print(f"\033[94mINFO: {msg}\033[0m")
+    write_line(f"\033[94mINFO: {msg}\033[0m")
+
+def print_dry_run(action):
+    """Print an action that --dry-run skipped."""
+    write_line(f"DRY-RUN: {action}")
 
 def confirm(prompt):
     """
     Prompt the user for a yes/no response.
     Returns True for 'y' or 'yes', False for 'n', 'no', or empty input.
+    Always returns True without prompting when ASSUME_YES is set.
     """
+    if ASSUME_YES:
+        print(f"{prompt} [y/N]: y")
+        return True
     while True:
         response = input(f"{prompt} [y/N]: ").lower().strip()
         if response in ('y', 'yes'):
@@ -56,110 +113,410 @@ def confirm(prompt):
         else:
             print("Please answer 'yes' or 'no'.")
 
-def run_command(command, error_message=None, check=True, shell=False):
+def run_command(command, error_message=None, check=True, capture=False):
     """
-    Run a shell command and handle errors.
+    Run a command and handle errors.
     Args:
-        command (list or str): The command to run (list for subprocess, str if shell=True).
+        command (list): The command and its arguments (no shell is involved).
         error_message (str, optional): Custom error message to display on failure.
         check (bool): If True, raise an exception on non-zero exit code.
-        shell (bool): If True, run the command through the shell.
+        capture (bool): If True, buffer stdout and stderr and return them (for short
+            queries). Otherwise stdout goes straight to the terminal and stderr is
+            echoed as it arrives, keeping only the last STDERR_TAIL_LINES lines.
     Returns:
-        subprocess.CompletedProcess: The result of the command execution.
+        subprocess.CompletedProcess: The result of the command execution. In
+            --dry-run mode the command is only printed and a successful empty
+            result is returned.
     """
+    if DRY_RUN:
+        print_dry_run(shlex.join(command))
+        return subprocess.CompletedProcess(args=command, returncode=0, stdout="", stderr="")
     try:
-        result = subprocess.run(
-            command,
-            shell=shell,
-            check=check,
-            text=True,
-            capture_output=True
-        )
-        return result
+        if capture:
+            return subprocess.run(
+                command,
+                check=check,
+                text=True,
+                capture_output=True
+            )
+        with subprocess.Popen(command, text=True, stderr=subprocess.PIPE) as proc:
+            stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+            for line in iter(proc.stderr.readline, ""):
+                write_line(line, sys.stderr)
+                stderr_tail.append(line)
+            returncode = proc.wait()
+        stderr = "".join(stderr_tail)
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+        return subprocess.CompletedProcess(command, returncode, stderr=stderr)
     except subprocess.CalledProcessError as e:
-        error_msg = error_message or f"Command '{' '.join(command) if isinstance(command, list) else command}' failed with exit code {e.returncode}"
-        print_error(f"{error_msg}\nOutput: {e.stderr}")
+        error_msg = error_message or f"Command '{' '.join(command)}' failed with exit code {e.returncode}"
+        if capture:
+            print_error(f"{error_msg}\nOutput: {e.stderr}")
+        elif error_message:
+            # stderr was already echoed as it arrived; name the command instead
+            print_error(f"{error_message}: '{' '.join(command)}' exited with {e.returncode}")
+        else:
+            print_error(error_msg)
         raise
     except Exception as e:
-        print_error(f"Unexpected error running command '{' '.join(command) if isinstance(command, list) else command}': {e}")
+        print_error(f"Unexpected error running command '{' '.join(command)}': {e}")
         raise
 
+def _cache_fresh(path, max_age_s=METADATA_MAX_AGE):
+    """Return True if path exists and was modified less than max_age_s seconds ago."""
+    try:
+        return (time.time() - path.stat().st_mtime) < max_age_s
+    except OSError:
+        return False
+
+def apt_metadata_fresh():
+    """
+    Return True if apt's package indexes exist and were refreshed recently.
+    Directory mtimes are not used: emptying /var/lib/apt/lists (a common
+    container cleanup step) bumps them too.
+    """
+    try:
+        with os.scandir(APT_LISTS_DIR) as it:
+            if not any("_Packages" in entry.name for entry in it):
+                return False
+    except OSError:
+        return False
+    return any(_cache_fresh(p) for p in APT_UPDATE_STAMPS + (UPDATE_SENTINEL,))
+
+def dnf_metadata_fresh():
+    """
+    Return True if every cached dnf repository was refreshed recently.
+    Freshness is read from each repository's repomd.xml, which dnf rewrites
+    or touches when it validates the repository.
+    """
+    repomds = [p for cache_dir in DNF_CACHE_DIRS for p in cache_dir.glob("*/repodata/repomd.xml")]
+    if not repomds:
+        return False
+    return _cache_fresh(UPDATE_SENTINEL) or all(_cache_fresh(p) for p in repomds)
+
+def _mark_metadata_refreshed():
+    """Touch the user-writable sentinel recording a successful package list refresh."""
+    if DRY_RUN:
+        return
+    try:
+        UPDATE_SENTINEL.touch()
+    except OSError:
+        pass
+
 def check_command_exists(command):
     """
     Check if a command is available on the system.
     Returns True if the command exists, False otherwise.
+    Positive results are remembered; misses are always re-checked, since an
+    installer may have just put the command on PATH.
+    """
+    if command in _FOUND_COMMANDS:
+        return True
+    if shutil.which(command) is None:
+        return False
+    _FOUND_COMMANDS.add(command)
+    return True
+
+def find_commands(commands):
+    """
+    Return the subset of commands that are executables on PATH.
+    Reads each PATH directory once instead of searching PATH per command.
+    """
+    wanted = set(commands)
+    found = wanted & _FOUND_COMMANDS
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        if found == wanted:
+            break
+        try:
+            with os.scandir(directory or os.curdir) as it:
+                for entry in it:
+                    if (entry.name in wanted and entry.name not in found
+                            and entry.is_file() and os.access(entry.path, os.X_OK)):
+                        found.add(entry.name)
+        except OSError:
+            pass
+    _FOUND_COMMANDS.update(found)
+    return found
+
+def open_url(url, timeout=30):
+    """
+    Open a URL for streaming.
+    Asks for an uncompressed response so the body can be copied straight to disk.
+    """
+    request = urllib.request.Request(
+        url, headers={"Accept-Encoding": "identity", "User-Agent": "nvim-setup/1.0"}
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+def download_file(url, path):
+    """
+    Download a URL to a local file in fixed-size chunks.
+    Unlike urlretrieve, memory use stays bounded by DOWNLOAD_CHUNK.
+    """
+    if DRY_RUN:
+        print_dry_run(f"download {url} -> {path}")
+        return
+    with open_url(url) as response, open(path, "wb") as f:
+        shutil.copyfileobj(response, f, DOWNLOAD_CHUNK)
+
+def lookup_sha256(checksums_url, filename):
+    """
+    Fetch a checksum file and return the SHA-256 digest it lists for filename.
+    Accepts both a bare digest (Go's .sha256 files) and sha256sum-style
+    "<digest>  <filename>" lines (GitHub release checksums.txt).
+    In --dry-run mode nothing is fetched and a placeholder digest is returned.
+    """
+    if DRY_RUN:
+        print_dry_run(f"fetch checksum for {filename} from {checksums_url}")
+        return "<sha256>"
+    with open_url(checksums_url) as response:
+        text = response.read().decode()
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) == 1 or (len(fields) == 2 and fields[1].lstrip("*") == filename):
+            return fields[0].lower()
+    raise ValueError(f"No checksum for {filename} in {checksums_url}")
+
+def download_verified(url, sha256, suffix=".tar.gz"):
+    """
+    Download url into the cache, verifying it against the expected SHA-256.
+    The file is hashed while it streams to disk, so it is read only once.
+    A cached file with the same digest is reused without downloading.
+    Returns:
+        Path: The verified file in DOWNLOAD_CACHE_DIR.
+    """
+    cache_path = DOWNLOAD_CACHE_DIR / f"{sha256}{suffix}"
+    if cache_path.exists():
+        print_info(f"Using cached download {cache_path}")
+        return cache_path
+    if DRY_RUN:
+        print_dry_run(f"download {url} -> {cache_path}")
+        return cache_path
+
+    DOWNLOAD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    partial_path = cache_path.with_name(cache_path.name + ".part")
+    digest = hashlib.sha256()
+    with open_url(url) as response, open(partial_path, "wb") as f:
+        for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    if digest.hexdigest() != sha256:
+        partial_path.unlink()
+        raise ValueError(f"Checksum mismatch for {url}: expected {sha256}, got {digest.hexdigest()}")
+    os.replace(partial_path, cache_path)
+    return cache_path
+
+def install_binary(source, destination):
+    """
+    Copy an executable from an open file object to destination (mode 755).
+    Writes in-process when the target directory is writable; otherwise the
+    binary is staged in a temporary directory and moved with sudo install.
+    """
+    target_dir = os.path.dirname(destination)
+    if os.access(target_dir, os.W_OK):
+        with open(destination, "wb") as f:
+            shutil.copyfileobj(source, f, DOWNLOAD_CHUNK)
+        os.chmod(destination, 0o755)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        staged = os.path.join(tmp_dir, os.path.basename(destination))
+        with open(staged, "wb") as f:
+            shutil.copyfileobj(source, f, DOWNLOAD_CHUNK)
+        run_command(
+            ["sudo", "install", "-m", "755", staged, destination],
+            f"Failed to install {destination}"
+        )
+
+def add_to_path(directory):
+    """Append a directory to PATH for the current session (thread-safe)."""
+    with _PATH_LOCK:
+        os.environ["PATH"] += os.pathsep + directory
+
+def keep_sudo_alive(interval=60):
     """
-    return shutil.which(command) is not None
+    Ask for sudo credentials once, then refresh the sudo timestamp in a
+    background thread, so later sudo calls (including concurrent ones from
+    the installer pool) never stop to prompt for a password.
+    Args:
+        interval (int): Seconds between refreshes.
+    Returns:
+        threading.Event: Set it to stop the refresher.
+    """
+    stop = threading.Event()
+    if os.geteuid() == 0 or DRY_RUN:
+        return stop
+
+    run_command(["sudo", "-v"], "Failed to obtain sudo credentials")
+
+    def refresh():
+        while not stop.wait(interval):
+            subprocess.run(["sudo", "-n", "-v"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    threading.Thread(target=refresh, daemon=True).start()
+    return stop
 
 # --- Distribution Detection ---
+@dataclass(frozen=True)
+class DistroInfo:
+    """Distribution details resolved once by detect_distribution and passed to the installers."""
+    family: str  # "redhat" or "debian"
+    release: str  # Running kernel release
+    arch: str  # Machine architecture (platform.machine())
+    pm: str  # Package manager executable: "dnf" or "apt-get"
+    header_pkg: str  # Kernel header package name, without the release suffix
+
 def detect_distribution():
     """
     Detect the Linux distribution family (Red Hat-based or Debian-based).
-    Returns 'redhat' for Red Hat-based systems, 'debian' for Debian-based systems,
+    Returns a DistroInfo for Red Hat-based or Debian-based systems,
     or None if the distribution is not supported.
     """
-    if not platform.system() == "Linux":
+    if not SYSTEM == "Linux":
         print_error("This script only supports Linux systems.")
         return None
 
+    # Look for both release files in a single directory read
+    try:
+        with os.scandir("/etc") as it:
+            etc_files = {entry.name for entry in it}
+    except OSError:
+        etc_files = set()
+
     # Check for Red Hat-based systems
-    if os.path.exists("/etc/redhat-release"):
-        return "redhat"
+    if "redhat-release" in etc_files:
+        return DistroInfo("redhat", KERNEL_RELEASE, platform.machine(), "dnf", "kernel-devel")
     # Check for Debian-based systems
-    elif os.path.exists("/etc/debian_version"):
-        return "debian"
+    elif "debian_version" in etc_files:
+        return DistroInfo("debian", KERNEL_RELEASE, platform.machine(), "apt-get", "linux-headers")
     else:
         print_error("Unsupported Linux distribution. This script supports Red Hat-based (Fedora, CentOS) and Debian-based (Ubuntu, Debian) systems.")
         return None
 
 # --- Installation Functions ---
-def install_with_apt(packages):
+def install_in_batches(install_command, packages, find_unavailable=None):
     """
-    Install packages using apt (Debian-based systems).
+    Install packages in as few package manager transactions as possible.
+    Everything is tried in one transaction first. If that fails, packages the
+    package manager reported as unavailable are dropped and the rest retried;
+    otherwise the list is split in half and each half retried (bisection),
+    so only the packages that really fail are reported. Errors that fail any
+    transaction (WHOLE_RUN_FAILURE, e.g. a held dpkg lock) raise RuntimeError
+    instead of being bisected.
     Args:
+        install_command (list): Command prefix, e.g. ["sudo", "apt-get", "install", "-y"].
         packages (list): List of package names to install.
+        find_unavailable (callable, optional): Maps a failed CompletedProcess to
+            the package names it reports as unavailable.
     Returns:
         list: List of packages that failed to install.
     """
-    print_info("Updating package lists with apt...")
-    run_command(["sudo", "apt", "update"], "Failed to update package lists")
+    if not packages:
+        return []
 
-    failed_packages = []
-    for package in packages:
-        try:
-            print_info(f"Installing package with apt: {package}")
-            run_command(
-                ["sudo", "apt", "install", "-y", package],
-                f"Failed to install package {package} with apt"
-            )
-        except subprocess.CalledProcessError as e:
-            print_warning(f"Failed to install {package}: {e.stderr}")
-            failed_packages.append(package)
+    result = run_command(install_command + packages, check=False)
+    if result.returncode == 0:
+        return []
 
-    return failed_packages
+    if WHOLE_RUN_FAILURE.search(result.stderr):
+        raise RuntimeError(f"'{' '.join(install_command)}' failed for a reason unrelated to the packages (see the output above)")
+
+    if len(packages) == 1:
+        # The package manager's output was already streamed to the terminal
+        print_warning(f"Failed to install {packages[0]} (exit code {result.returncode})")
+        return list(packages)
+
+    unavailable = [p for p in (find_unavailable(result) if find_unavailable else []) if p in packages]
+    if unavailable:
+        print_warning(f"Packages not available: {', '.join(unavailable)}")
+        remaining = [p for p in packages if p not in unavailable]
+        return unavailable + install_in_batches(install_command, remaining, find_unavailable)
+
+    middle = len(packages) // 2
+    return (install_in_batches(install_command, packages[:middle], find_unavailable)
+            + install_in_batches(install_command, packages[middle:], find_unavailable))
 
-def install_with_dnf(packages):
+def apt_unavailable_packages(result):
+    """Return the package names apt reported as unknown or without an installation candidate."""
+    matches = re.findall(
+        r"E: (?:Unable to locate package (\S+)|Package '(\S+)' has no installation candidate)",
+        result.stderr,
+    )
+    return [located or candidate for located, candidate in matches]
+
+def configure_package_manager_parallelism(info):
+    """
+    Return command-line options that make the package manager download in parallel.
+    The settings are passed per invocation (-o for apt, --setopt for dnf) so the
+    system-wide configuration is left untouched.
+    Args:
+        info (DistroInfo): The detected distribution.
+    Returns:
+        list: Options to add to every apt/dnf command.
+    """
+    if info.family == "redhat":
+        return ["--setopt=max_parallel_downloads=10", "--setopt=fastestmirror=True"]
+    return ["-o", "Acquire::Queue-Mode=host", "-o", "Acquire::http::Pipeline-Depth=10"]
+
+def install_with_apt(info, packages, options=()):
+    """
+    Install packages using apt (Debian-based systems).
+    All packages go into a single apt-get transaction; see install_in_batches.
+    Args:
+        info (DistroInfo): The detected distribution.
+        packages (list): List of package names to install.
+        options (list, optional): Extra apt options, e.g. from configure_package_manager_parallelism.
+    Returns:
+        list: List of packages that failed to install.
+    """
+    if apt_metadata_fresh():
+        print_info("Package lists were refreshed recently, skipping apt update.")
+    else:
+        print_info("Updating package lists with apt...")
+        run_command(["sudo", info.pm, "update"] + list(options), "Failed to update package lists")
+        _mark_metadata_refreshed()
+
+    print_info(f"Installing {len(packages)} packages with apt...")
+    return install_in_batches(
+        ["sudo", info.pm, "install", "-y"] + list(options), packages, apt_unavailable_packages
+    )
+
+def install_with_dnf(info, packages, options=()):
     """
     Install packages using dnf (Red Hat-based systems).
+    All packages go into a single dnf transaction. --skip-broken lets the
+    transaction succeed without the packages that cannot be installed, and
+    those are then identified with a single rpm query.
     Args:
+        info (DistroInfo): The detected distribution.
         packages (list): List of package names to install.
+        options (list, optional): Extra dnf options, e.g. from configure_package_manager_parallelism.
     Returns:
         list: List of packages that failed to install.
     """
-    print_info("Updating package lists with dnf...")
-    run_command(["sudo", "dnf", "check-update"], "Failed to update package lists", check=False)
+    if dnf_metadata_fresh():
+        print_info("Package metadata was refreshed recently, skipping dnf check-update.")
+    else:
+        print_info("Updating package lists with dnf...")
+        result = run_command(["sudo", info.pm, "check-update"] + list(options), "Failed to update package lists", check=False)
+        # check-update exits with 100 when updates are available
+        if result.returncode in (0, 100):
+            _mark_metadata_refreshed()
 
-    failed_packages = []
-    for package in packages:
-        try:
-            print_info(f"Installing package with dnf: {package}")
-            run_command(
-                ["sudo", "dnf", "install", "-y", package],
-                f"Failed to install package {package} with dnf"
-            )
-        except subprocess.CalledProcessError as e:
-            print_warning(f"Failed to install {package}: {e.stderr}")
-            failed_packages.append(package)
+    print_info(f"Installing {len(packages)} packages with dnf...")
+    failed_packages = install_in_batches(["sudo", info.pm, "install", "-y", "--skip-broken"] + list(options), packages)
+
+    # Packages skipped by --skip-broken do not fail the transaction. rpm -q
+    # matches package names and full NEVRAs (kernel-devel-<release>); only the
+    # misses are re-checked as capabilities, which dnf also accepts.
+    result = run_command(["rpm", "-q"] + packages, check=False, capture=True)
+    missing = re.findall(r"package (\S+) is not installed", result.stdout)
+    if missing:
+        result = run_command(["rpm", "-q", "--whatprovides"] + missing, check=False, capture=True)
+        for name in re.findall(r"no package provides (\S+)", result.stdout):
+            if name not in failed_packages:
+                print_warning(f"Failed to install {name}")
+                failed_packages.append(name)
 
     return failed_packages
 
@@ -177,15 +534,15 @@ def install_rustup():
     # Download and run the rustup installation script
     rustup_url = "https://sh.rustup.rs"
     rustup_script = "rustup-init.sh"
-    urllib.request.urlretrieve(rustup_url, rustup_script)
+    download_file(rustup_url, rustup_script)
     run_command(
-        f"sh {rustup_script} -y",
-        "Failed to install rustup",
-        shell=True
+        ["sh", rustup_script, "-y"],
+        "Failed to install rustup"
     )
-    os.remove(rustup_script)
+    if not DRY_RUN:
+        os.remove(rustup_script)
     # Add rustup to the PATH for the current session
-    os.environ["PATH"] += os.pathsep + os.path.expanduser("~/.cargo/bin")
+    add_to_path(os.path.expanduser("~/.cargo/bin"))
     # Install rustfmt
     run_command(
         ["rustup", "component", "add", "rustfmt"],
@@ -196,7 +553,9 @@ def install_go():
     """
     Install Go if not already installed.
     Go is needed for gopls, gofmt, goimports, and delve.
-    Uses urllib.request to download the Go tarball.
+    Downloads the Go tarball (verified against its published SHA-256, and
+    cached) with urllib.request and unpacks it with tarfile, falling back to
+    sudo tar only when /usr/local is not writable.
     """
     if check_command_exists("go"):
         print_info("Go is already installed.")
@@ -207,26 +566,33 @@ def install_go():
     go_version = "1.22.2"
     go_tar = f"go{go_version}.linux-amd64.tar.gz"
     go_url = f"https://go.dev/dl/{go_tar}"
-    urllib.request.urlretrieve(go_url, go_tar)
+    go_sha256 = lookup_sha256(f"{go_url}.sha256", go_tar)
+    go_archive = download_verified(go_url, go_sha256)
     # Extract and install Go
-    run_command(
-        ["sudo", "tar", "-C", "/usr/local", "-xzf", go_tar],
-        "Failed to extract Go tarball"
-    )
-    # Remove the downloaded tarball
-    os.remove(go_tar)
+    if DRY_RUN:
+        print_dry_run(f"extract {go_archive} into /usr/local")
+    elif os.access("/usr/local", os.W_OK):
+        with tarfile.open(go_archive, "r:gz") as tf:
+            # Refuse absolute paths and links out of the tree where supported
+            tf.extraction_filter = getattr(tarfile, "data_filter", None)
+            tf.extractall("/usr/local")
+    else:
+        run_command(
+            ["sudo", "tar", "-C", "/usr/local", "-xzf", str(go_archive)],
+            "Failed to extract Go tarball"
+        )
     # Add Go to the PATH for the current session
-    os.environ["PATH"] += os.pathsep + "/usr/local/go/bin"
+    add_to_path("/usr/local/go/bin")
     # Verify installation
-    if not check_command_exists("go"):
-        print_error("Go installation failed.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("go"):
+        raise RuntimeError("Go installation failed.")
 
 def install_lazygit():
     """
     Install lazygit if not already installed.
     Lazygit is used by toggleterm.nvim for Git integration.
-    Uses urllib.request to download the lazygit tarball.
+    Downloads the lazygit tarball (verified against the release checksums,
+    and cached) with urllib.request and reads the binary out with tarfile.
     """
     if check_command_exists("lazygit"):
         print_info("lazygit is already installed.")
@@ -236,71 +602,104 @@ def install_lazygit():
     # Download the latest lazygit release (adjust version as needed)
     lazygit_version = "0.40.2"
     lazygit_tar = f"lazygit_{lazygit_version}_Linux_x86_64.tar.gz"
-    lazygit_url = f"https://github.com/jesseduffield/lazygit/releases/download/v{lazygit_version}/{lazygit_tar}"
-    urllib.request.urlretrieve(lazygit_url, lazygit_tar)
-    # Extract the tarball
-    run_command(
-        ["tar", "-xzf", lazygit_tar],
-        "Failed to extract lazygit tarball"
-    )
-    # Move the binary to /usr/local/bin
-    run_command(
-        ["sudo", "mv", "lazygit", "/usr/local/bin/"],
-        "Failed to install lazygit binary"
-    )
-    # Remove the downloaded tarball
-    os.remove(lazygit_tar)
+    lazygit_release = f"https://github.com/jesseduffield/lazygit/releases/download/v{lazygit_version}"
+    lazygit_sha256 = lookup_sha256(f"{lazygit_release}/checksums.txt", lazygit_tar)
+    lazygit_archive = download_verified(f"{lazygit_release}/{lazygit_tar}", lazygit_sha256)
+    # Copy only the binary from the tarball into /usr/local/bin
+    if DRY_RUN:
+        print_dry_run(f"install lazygit from {lazygit_archive} into /usr/local/bin")
+    else:
+        with tarfile.open(lazygit_archive, "r:gz") as tf:
+            install_binary(tf.extractfile("lazygit"), "/usr/local/bin/lazygit")
     # Verify installation
-    if not check_command_exists("lazygit"):
-        print_error("lazygit installation failed.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("lazygit"):
+        raise RuntimeError("lazygit installation failed.")
 
-def install_golangci_lint():
+def install_golangci_lint(info):
     """
     Install golangci-lint if not already installed.
     golangci-lint is used by vim-go for Go linting.
     Requires Go to be installed.
+    Downloads the pinned release tarball (verified against the release
+    checksums, and cached) and extracts the binary into GOPATH/bin.
+    Args:
+        info (DistroInfo): The detected distribution (for the architecture).
     """
     if check_command_exists("golangci-lint"):
         print_info("golangci-lint is already installed.")
         return
 
-    if not check_command_exists("go"):
-        print_error("Go must be installed before installing golangci-lint.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("go"):
+        raise RuntimeError("Go must be installed before installing golangci-lint.")
+
+    arch = {"x86_64": "amd64", "aarch64": "arm64"}.get(info.arch)
+    if arch is None:
+        raise RuntimeError(f"No golangci-lint release for architecture {info.arch}.")
 
     print_info("Installing golangci-lint...")
-    run_command(
-        "curl -sSfL https://raw.githubusercontent.com/golangci/golangci-lint/master/install.sh | sh -s -- -b $(go env GOPATH)/bin v1.55.2",
-        "Failed to install golangci-lint",
-        shell=True
+    # Download the pinned golangci-lint release (adjust version as needed)
+    golangci_lint_version = "1.55.2"
+    golangci_lint_name = f"golangci-lint-{golangci_lint_version}-linux-{arch}"
+    golangci_lint_release = f"https://github.com/golangci/golangci-lint/releases/download/v{golangci_lint_version}"
+    golangci_lint_sha256 = lookup_sha256(
+        f"{golangci_lint_release}/golangci-lint-{golangci_lint_version}-checksums.txt",
+        f"{golangci_lint_name}.tar.gz"
+    )
+    golangci_lint_archive = download_verified(
+        f"{golangci_lint_release}/{golangci_lint_name}.tar.gz", golangci_lint_sha256
     )
+    # Extract only the binary into GOPATH/bin (the same place install.sh used)
+    gopath = os.environ.get("GOPATH") or os.path.expanduser("~/go")
+    bin_dir = Path(gopath.split(os.pathsep)[0]) / "bin"
+    if DRY_RUN:
+        print_dry_run(f"install golangci-lint from {golangci_lint_archive} into {bin_dir}")
+    else:
+        bin_dir.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(golangci_lint_archive, "r:gz") as tf:
+            install_binary(
+                tf.extractfile(f"{golangci_lint_name}/golangci-lint"),
+                str(bin_dir / "golangci-lint")
+            )
     # Add GOPATH/bin to the PATH for the current session
-    os.environ["PATH"] += os.pathsep + os.path.expanduser("~/go/bin")
+    add_to_path(str(bin_dir))
     # Verify installation
-    if not check_command_exists("golangci-lint"):
-        print_error("golangci-lint installation failed.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("golangci-lint"):
+        raise RuntimeError("golangci-lint installation failed.")
 
-def install_stylua():
+def install_stylua(info):
     """
-    Install stylua using cargo (Rust package manager).
+    Install stylua from its prebuilt release binary.
     Stylua is a Lua formatter used by conform.nvim.
-    Requires rustup to be installed.
+    Uses urllib.request to download the release zip, so no Rust toolchain
+    (or compile) is needed.
+    Args:
+        info (DistroInfo): The detected distribution (for the architecture).
     """
     if check_command_exists("stylua"):
         print_info("stylua is already installed.")
         return
 
-    if not check_command_exists("cargo"):
-        print_error("cargo must be installed before installing stylua (run rustup installation first).")
-        sys.exit(1)
+    arch = {"x86_64": "x86_64", "aarch64": "aarch64"}.get(info.arch)
+    if arch is None:
+        raise RuntimeError(f"No stylua release for architecture {info.arch}.")
 
-    print_info("Installing stylua with cargo...")
-    run_command(
-        ["cargo", "install", "stylua"],
-        "Failed to install stylua with cargo"
-    )
+    print_info("Installing stylua...")
+    # Download the stylua release (adjust version as needed)
+    stylua_version = "0.20.0"
+    stylua_zip = f"stylua-linux-{arch}.zip"
+    stylua_url = f"https://github.com/JohnnyMorganz/StyLua/releases/download/v{stylua_version}/{stylua_zip}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = os.path.join(tmp_dir, stylua_zip)
+        download_file(stylua_url, zip_path)
+        # Copy the binary straight out of the zip into /usr/local/bin
+        if DRY_RUN:
+            print_dry_run(f"install stylua from {zip_path} into /usr/local/bin")
+        else:
+            with zipfile.ZipFile(zip_path) as z, z.open("stylua") as binary:
+                install_binary(binary, "/usr/local/bin/stylua")
+    # Verify installation
+    if not DRY_RUN and not check_command_exists("stylua"):
+        raise RuntimeError("stylua installation failed.")
 
 def install_pip_packages(packages):
     """
@@ -309,13 +708,14 @@ def install_pip_packages(packages):
     Args:
         packages (list): List of package names to install.
     """
-    if not check_command_exists("pip3"):
-        print_error("pip3 must be installed before installing Python packages.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("pip3"):
+        raise RuntimeError("pip3 must be installed before installing Python packages.")
 
     print_info(f"Installing Python packages with pip: {', '.join(packages)}")
     run_command(
-        ["pip3", "install"] + packages,  # Install in the active environment
+        # Install in the active environment; skip the version check and
+        # prompts, and take wheels over sdists when both exist
+        ["pip3", "install", "--disable-pip-version-check", "--no-input", "--prefer-binary"] + packages,
         "Failed to install Python packages with pip"
     )
 
@@ -325,13 +725,13 @@ def install_npm_packages(packages):
     Args:
         packages (list): List of package names to install.
     """
-    if not check_command_exists("npm"):
-        print_error("npm must be installed before installing Node.js packages.")
-        sys.exit(1)
+    if not DRY_RUN and not check_command_exists("npm"):
+        raise RuntimeError("npm must be installed before installing Node.js packages.")
 
     print_info(f"Installing Node.js packages with npm: {', '.join(packages)}")
     run_command(
-        ["npm", "install", "-g"] + packages,
+        # Reuse the local cache when possible and skip audit/funding/progress output
+        ["npm", "install", "-g", "--prefer-offline", "--no-audit", "--no-fund", "--no-progress"] + packages,
         "Failed to install Node.js packages with npm"
     )
 
@@ -351,14 +751,18 @@ def update_neovim_config():
     print_info("Updating Neovim configuration for Linux kernel development...")
 
     # Read the existing lazy.lua file
-    with open(lazy_file, 'r') as f:
-        content = f.read()
+    content = lazy_file.read_text()
 
     # Find the require('lazy').setup call and add new plugins
-    if "require('lazy').setup({" not in content:
+    marker = "require('lazy').setup({"
+    if marker not in content:
         print_error("Could not find require('lazy').setup in lazy.lua")
         return
 
+    if "'vivien/vim-linux-coding-style'" in content:
+        print_info("Linux kernel plugins are already configured.")
+        return
+
     # Define the new plugins to add
     new_plugins = dedent("""
           -- Linux kernel coding style
@@ -393,37 +797,39 @@ def update_neovim_config():
           },
     """)
 
-    # Insert the new plugins into the require('lazy').setup table
-    # Find the first plugin entry and insert after it
-    lines = content.splitlines()
-    for i, line in enumerate(lines):
-        if line.strip().startswith("{"):
-            # Insert the new plugins after the first plugin entry
-            lines.insert(i + 1, new_plugins)
-            break
+    # Insert the new plugins at the start of the require('lazy').setup table
+    updated_content = content.replace(marker, marker + new_plugins, 1)
 
-    # Write the updated content back to lazy.lua
-    updated_content = "\n".join(lines)
-    with open(lazy_file, 'w') as f:
-        f.write(updated_content)
+    if DRY_RUN:
+        print_dry_run(f"add the Linux kernel plugins to {lazy_file}")
+        return
+
+    # Write the updated content back to lazy.lua atomically, so an interrupted
+    # run never leaves a half-written config
+    tmp_file = lazy_file.with_name(lazy_file.name + ".tmp")
+    tmp_file.write_text(updated_content)
+    # The tmp file is a new inode created with the umask; keep lazy.lua's mode
+    shutil.copymode(lazy_file, tmp_file)
+    os.replace(tmp_file, lazy_file)
 
     print_success("Neovim configuration updated with Linux kernel plugins.")
 
 # --- Main Installation Function ---
-def install_tools():
+def install_tools(verify=True):
     """
     Main function to install all tools required for the Neovim setup,
     including tools for Linux kernel coding and debugging.
     Detects the distribution and installs tools accordingly.
+    Args:
+        verify (bool): If True, check that every tool ended up on PATH.
     """
     # Detect the Linux distribution
-    distro = detect_distribution()
-    if not distro:
+    info = detect_distribution()
+    if not info:
         sys.exit(1)
 
     # Define the packages to install based on the distribution
-    if distro == "redhat":
-        package_manager = "dnf"
+    if info.family == "redhat":
         packages = [
             "neovim",  # Neovim editor
             "git",  # For cloning plugins
@@ -449,11 +855,10 @@ def install_tools():
             "qemu-system-x86",  # For running a virtual machine to test the kernel
             "strace",  # For tracing system calls
             "ltrace",  # For tracing library calls
-            f"kernel-devel-{platform.release()}",  # Kernel headers for the current kernel
+            f"{info.header_pkg}-{info.release}",  # Kernel headers for the current kernel
             "ncurses-devel",  # For menuconfig
         ]
     else:  # Debian-based
-        package_manager = "apt"
         packages = [
             "neovim",  # Neovim editor
             "git",  # For cloning plugins
@@ -481,46 +886,72 @@ def install_tools():
             "qemu-system-x86",  # For running a virtual machine to test the kernel
             "strace",  # For tracing system calls
             "ltrace",  # For tracing library calls
-            f"linux-headers-{platform.release()}",  # Kernel headers for the current kernel
+            f"{info.header_pkg}-{info.release}",  # Kernel headers for the current kernel
             "libncurses-dev",  # For menuconfig
         ]
 
     # Prompt the user to confirm installation
-    if not confirm(f"Install Neovim and required tools using {package_manager} ({', '.join(packages)})?"):
+    if not confirm(f"Install Neovim and required tools using {info.pm} ({', '.join(packages)})?"):
         print_warning("Installation aborted by user.")
         sys.exit(0)
 
+    # Authenticate once up front; the refresher is a daemon thread, so an
+    # early sys.exit below does not need to stop it
+    try:
+        sudo_keepalive = keep_sudo_alive()
+    except Exception:
+        # run_command has already reported why sudo failed
+        sys.exit(1)
+
     # Install packages using the appropriate package manager
+    options = configure_package_manager_parallelism(info)
     try:
-        if distro == "redhat":
-            failed_packages = install_with_dnf(packages)
+        if info.family == "redhat":
+            failed_packages = install_with_dnf(info, packages, options)
         else:
-            failed_packages = install_with_apt(packages)
+            failed_packages = install_with_apt(info, packages, options)
         if failed_packages:
             print_warning(f"The following packages failed to install: {', '.join(failed_packages)}")
     except Exception as e:
         print_error(f"Failed to install packages: {e}")
         sys.exit(1)
 
-    # Install additional tools that require special handling
+    # Install additional tools that require special handling.
+    # These are mostly downloads and subprocesses, so run the independent ones
+    # concurrently; only golangci-lint waits, since it needs Go.
+    # Installers raise on failure; the first failure cancels the ones that
+    # have not started yet (running ones finish before the process exits).
+    # A dry run goes one installer at a time, so the printed plan is in a
+    # fixed order.
+    executor = ThreadPoolExecutor(max_workers=1 if DRY_RUN else 6)
     try:
-        # Install rustup for Rust tools
-        install_rustup()
         # Install Go for Go tools
-        install_go()
-        # Install lazygit for Git integration
-        install_lazygit()
-        # Install golangci-lint for Go linting
-        install_golangci_lint()
-        # Install stylua with cargo
-        install_stylua()
-        # Install Python packages
-        install_pip_packages(["black", "isort"])
-        # Install Node.js packages (removed stylua)
-        install_npm_packages(["prettier"])
+        go_done = executor.submit(install_go)
+        pending = {
+            go_done,
+            # Install rustup for Rust tools
+            executor.submit(install_rustup),
+            # Install lazygit for Git integration
+            executor.submit(install_lazygit),
+            # Install Python packages
+            executor.submit(install_pip_packages, ["black", "isort"]),
+            # Install Node.js packages (removed stylua)
+            executor.submit(install_npm_packages, ["prettier"]),
+            # Install stylua from its prebuilt binary
+            executor.submit(install_stylua, info),
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+                if future is go_done:
+                    # Install golangci-lint for Go linting once Go is in place
+                    pending.add(executor.submit(install_golangci_lint, info))
     except Exception as e:
+        executor.shutdown(wait=False, cancel_futures=True)
         print_error(f"Failed to install additional tools: {e}")
         sys.exit(1)
+    executor.shutdown()
 
     # Update Neovim configuration with Linux kernel plugins
     try:
@@ -529,7 +960,16 @@ def install_tools():
         print_error(f"Failed to update Neovim configuration: {e}")
         print_warning("You may need to manually add the Linux kernel plugins to your configuration.")
 
-    # Verify installations
+    sudo_keepalive.set()
+
+    if verify:
+        verify_tools()
+
+def verify_tools():
+    """
+    Check that every tool the Neovim setup relies on is on PATH and report
+    the missing ones.
+    """
     print_info("Verifying installations...")
     tools_to_verify = [
         "nvim", "git", "curl", "unzip", "node", "npm", "python3", "pip3",
@@ -540,8 +980,9 @@ def install_tools():
         "qemu-system-x86_64", "strace", "ltrace"
     ]
     missing_tools = []
+    installed_tools = find_commands(tools_to_verify)
     for tool in tools_to_verify:
-        if not check_command_exists(tool):
+        if tool not in installed_tools:
             missing_tools.append(tool)
             print_warning(f"{tool} is not installed or not in PATH.")
         else:
@@ -555,8 +996,19 @@ def install_tools():
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Install the tools used by the Neovim setup on Linux.")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="answer yes to all prompts (same as NVIM_SETUP_YES=1)")
+    parser.add_argument("--skip-verify", action="store_true",
+                        help="skip the final check that every tool is on PATH")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="print the commands, downloads and file changes without performing them (implies --yes)")
+    args = parser.parse_args()
+    DRY_RUN = args.dry_run
+    ASSUME_YES = ASSUME_YES or args.yes or DRY_RUN
+
     print("--- Neovim Tools Installation for Linux ---")
-    print(f"System: {platform.system()} {platform.release()}")
+    print(f"System: {SYSTEM} {KERNEL_RELEASE}")
     print("-" * 40)
 
     # Check if the script is running with sufficient privileges
@@ -565,9 +1017,13 @@ if __name__ == "__main__":
         print_info("You may be prompted for your sudo password during installation.")
 
     # Run the installation process
-    install_tools()
+    # Nothing was installed in --dry-run mode, so there is nothing to verify
+    install_tools(verify=not (args.skip_verify or DRY_RUN))
 
     print("-" * 40)
+    if DRY_RUN:
+        print_info("Dry run finished; nothing was changed.")
+        sys.exit(0)
     print_success("Neovim tools installation complete!")
     print("\nNext Steps:")
     print("1. Launch Neovim (`nvim`) and let lazy.nvim install the new plugins.")